@@ -8,6 +8,7 @@
 # Import necessary modules
 
 import pandas as pd
+import numpy as np
 import argparse
 from tqdm import tqdm
 
@@ -27,24 +28,27 @@ vcf = pd.read_table(args.vcf, skiprows=args.rownum)
 
 # Read haploid individual list
 with open(args.list, 'r') as file:
-    haploid_individuals = set(file.read().splitlines())  # Use a set for faster lookups
+    haploid_set = set(file.read().splitlines())  # Use a set for faster lookups
 
-# Ensure individuals exist in the VCF
-haploid_individuals = [ind for ind in haploid_individuals if ind in vcf.columns]
+# Ensure individuals exist in the VCF, keep VCF column order
+haploid_individuals = [ind for ind in vcf.columns if ind in haploid_set]
 if not haploid_individuals:
     print("Warning: No individuals in the list match the VCF column names.")
 
 # Function to find heterozygous positions
 def find_heterozygous_positions(df, individuals):
-    het_positions = []
+    chrom_arr = df["#CHROM"].to_numpy()
+    pos_arr = df["POS"].to_numpy()
+    hit_idx = []
     for ind in tqdm(individuals, desc="Scanning for heterozygous positions", unit="individual"):
-        for index, genotype in df[ind].items():
+        for index, genotype in enumerate(df[ind].to_numpy()):
             if isinstance(genotype, str) and ":" in genotype:
                 genotype_field = genotype.split(":")[0]  # Extract first field (genotype)
                 alleles = set(genotype_field.replace("|", "/").split("/"))
                 if len(alleles) > 1:  # Heterozygous check
-                    het_positions.append([df.at[index, "#CHROM"], df.at[index, "POS"]])
-    return pd.DataFrame(het_positions, columns=['#CHROM', 'POS']).drop_duplicates()
+                    hit_idx.append(index)
+    hit_idx = np.unique(np.asarray(hit_idx, dtype=np.int64))
+    return pd.DataFrame({'#CHROM': chrom_arr[hit_idx], 'POS': pos_arr[hit_idx]})
 
 # If --matt is specified, output heterozygous positions without modifying the VCF
 if args.matt:
@@ -58,12 +62,11 @@ else:
         for ind in tqdm(individuals, desc="Processing individuals", unit="individual"):
             for index, genotype in df[ind].items():
                 if isinstance(genotype, str) and ":" in genotype:
-                    fields = genotype.split(":")  # Split genotype field
-                    genotype_field = fields[0]  # Extract only genotype
+                    colon = genotype.index(":")
+                    genotype_field = genotype[:colon]  # Extract only genotype
                     alleles = set(genotype_field.replace("|", "/").split("/"))
                     if len(alleles) > 1:  # If heterozygous
-                        fields[0] = "./."  # Replace only the genotype field
-                        df.at[index, ind] = ":".join(fields)  # Reconstruct full string
+                        df.at[index, ind] = "./." + genotype[colon:]  # Replace only the genotype field
 
     # Process the VCF
     set_heterozygous_to_missing(vcf, haploid_individuals)
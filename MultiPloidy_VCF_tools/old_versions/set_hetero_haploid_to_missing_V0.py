@@ -35,18 +35,25 @@ with open(args.list, 'r') as file:
 
 # Function to set heterozygous positions to missing for every haploid individual
 def filter_heterozygous(df, list_of_males):
+    list_of_males = [c for c in list_of_males if c in df.columns]
     for c in tqdm(list_of_males, desc="Processing haploids", unit="haploid"):
-        for index, value in df[c].items():
-            if '/' in value:
-                alleles = value.split('/')
-            elif '|' in value:
-                alleles = value.split('|')
-            else:
-                continue
-
-            # Check if any alleles are dissimilar
-            if len(set(alleles)) > 1:
-                df.at[index, c] = './.'
+        fields = df[c].astype('string').str.split(':', n=1, expand=True)
+        genotype = fields[0].astype('category')
+
+        # Only a handful of distinct genotypes exist: check if any alleles are dissimilar once per category
+        categories = genotype.cat.categories
+        het_categories = categories[[len(set(gt.replace('|', '/').split('/'))) > 1 for gt in categories]]
+        het = genotype.isin(het_categories).fillna(False).astype(bool)
+
+        if not het.any():
+            continue
+
+        # Keep any FORMAT fields that follow the genotype
+        if 1 in fields.columns:
+            rest = fields.loc[het, 1]
+            df.loc[het, c] = np.where(rest.isna(), './.', './.:' + rest.fillna(''))
+        else:
+            df.loc[het, c] = './.'
 
 # Call the function
 filter_heterozygous(vcf, list_of_males)
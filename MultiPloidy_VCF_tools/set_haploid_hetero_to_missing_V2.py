@@ -8,8 +8,9 @@
 #!python3
 
 import pandas as pd
+import numpy as np
 import argparse
-import re
+import sys
 from tqdm import tqdm
 
 # Argument Parser
@@ -29,31 +30,47 @@ vcf = pd.read_table(args.vcf, skiprows=args.rownum)
 
 # Read haploid individual list
 with open(args.list, 'r') as file:
-    haploid_individuals = set(file.read().splitlines())
+    haploid_set = set(file.read().splitlines())
 
-# Ensure individuals exist in the VCF
-haploid_individuals = [ind for ind in haploid_individuals if ind in vcf.columns]
+# Ensure individuals exist in the VCF, keep VCF column order
+haploid_individuals = [ind for ind in vcf.columns if ind in haploid_set]
 if not haploid_individuals:
     print("Error: No valid haploid individuals found in VCF. Exiting.")
     exit(1)
 
+# Progress bars per individual only, silent when stderr is not a terminal
+progress_kwargs = dict(disable=not sys.stderr.isatty(), mininterval=0.5)
+
+# GT separators are single chars: map '|' to '/' and use str.split (no regex)
+pipe_to_slash = str.maketrans('|', '/')
+
+# Function to flag heterozygous genotypes of one individual (column-wise)
+def heterozygous_mask(genotypes):
+    genotypes = genotypes.astype("string")
+    has_fields = genotypes.str.contains(":", regex=False).fillna(False).astype(bool)
+    # Only a handful of distinct genotypes exist: check each category once
+    genotype_field = genotypes.str.split(":", n=1).str[0].astype("category")
+    categories = genotype_field.cat.categories
+    het_categories = categories[[len(set(gt.translate(pipe_to_slash).split('/'))) > 1 for gt in categories]]
+    return genotype_field.isin(het_categories).fillna(False).astype(bool) & has_fields
+
 # Function to check heterozygosity via GT field
 def find_heterozygous_positions(df, individuals):
-    het_positions = []
-    for ind in tqdm(individuals, desc="Scanning for heterozygous positions", unit="individual"):
-        for index, genotype in df[ind].items():
-            if isinstance(genotype, str) and ":" in genotype:
-                genotype_field = genotype.split(":")[0]
-                alleles = set(re.split(r'[|/]', genotype_field))
-                if len(alleles) > 1:  # Heterozygous check
-                    het_positions.append([df.at[index, "#CHROM"], df.at[index, "POS"]])
-    return pd.DataFrame(het_positions, columns=['#CHROM', 'POS']).drop_duplicates()
+    chrom_arr = df['#CHROM'].to_numpy()
+    pos_arr = df['POS'].to_numpy()
+    hit_idx = []
+    for ind in tqdm(individuals, desc="Scanning for heterozygous positions", unit="individual", **progress_kwargs):
+        hit_idx.extend(np.flatnonzero(heterozygous_mask(df[ind]).to_numpy()))
+    hit_idx = np.unique(np.asarray(hit_idx, dtype=np.int64))
+    return pd.DataFrame({'#CHROM': chrom_arr[hit_idx], 'POS': pos_arr[hit_idx]})
 
 # Function to check allele balance via AD field
 def find_AD_outliers(df, individuals):
-    ad_positions = []
-    for ind in tqdm(individuals, desc="Checking AD values", unit="individual"):
-        for index, genotype in df[ind].items():
+    chrom_arr = df['#CHROM'].to_numpy()
+    pos_arr = df['POS'].to_numpy()
+    hit_idx = []
+    for ind in tqdm(individuals, desc="Checking AD values", unit="individual", **progress_kwargs):
+        for index, genotype in enumerate(df[ind].to_numpy()):
             if isinstance(genotype, str) and ":" in genotype:
                 fields = genotype.split(":")
                 if len(fields) > 1:  # Ensure AD field exists
@@ -64,10 +81,11 @@ def find_AD_outliers(df, individuals):
                             if AD1 > 0:  # Avoid division by zero
                                 ratio = AD2 / AD1
                                 if 0.2 <= ratio <= 1.8:  # Check ratio
-                                    ad_positions.append([df.at[index, "#CHROM"], df.at[index, "POS"]])
+                                    hit_idx.append(index)
                         except ValueError:
                             continue  # Skip invalid entries
-    return pd.DataFrame(ad_positions, columns=['#CHROM', 'POS']).drop_duplicates()
+    hit_idx = np.unique(np.asarray(hit_idx, dtype=np.int64))
+    return pd.DataFrame({'#CHROM': chrom_arr[hit_idx], 'POS': pos_arr[hit_idx]})
 
 # If --matt is specified, output the positions only
 if args.matt:
@@ -85,15 +103,10 @@ if args.matt:
 
 # Function to modify heterozygous genotypes
 def set_heterozygous_to_missing(df, individuals):
-    for ind in tqdm(individuals, desc="Processing individuals", unit="individual"):
-        for index, genotype in df[ind].items():
-            if isinstance(genotype, str) and ":" in genotype:
-                fields = genotype.split(":")
-                genotype_field = fields[0]
-                alleles = set(re.split(r'[|/]', genotype_field))
-                if len(alleles) > 1:
-                    fields[0] = "./."
-                    df.at[index, ind] = ":".join(fields)
+    for ind in tqdm(individuals, desc="Processing individuals", unit="individual", **progress_kwargs):
+        mask = heterozygous_mask(df[ind])
+        if mask.any():
+            df.loc[mask, ind] = df.loc[mask, ind].astype("string").str.replace(r"^[^:]*", "./.", n=1, regex=True)
 
 # Modify heterozygous genotypes and save VCF
 set_heterozygous_to_missing(vcf, haploid_individuals)
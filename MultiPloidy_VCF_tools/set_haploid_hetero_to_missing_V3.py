@@ -14,12 +14,42 @@ Updated: multi-allelic AD support + bgzip/gzip VCF reading + robust AD parsing v
 Update2: In --AD mode, ignore positions where any AD value is 0
 """
 
+import numpy as np
 import pandas as pd
 import argparse
 import re
+import sys
 import gzip
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache, partial
 from tqdm import tqdm
-from typing import Optional, List
+from typing import Optional, List, Tuple
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+try:
+    import pyarrow
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+try:
+    import polars as pl
+    HAVE_POLARS = True
+except ImportError:
+    HAVE_POLARS = False
+
+try:
+    # Optional C line parser, build with: cythonize -i vcf_haploid_fix.pyx
+    import vcf_haploid_fix
+    HAVE_VCF_HAPLOID_FIX = True
+except ImportError:
+    HAVE_VCF_HAPLOID_FIX = False
 
 
 # -------------------------
@@ -36,32 +66,170 @@ def open_maybe_gzip(path: str, mode: str = "rt"):
     return open(path, mode)
 
 
-def pandas_read_vcf_table(path: str, skiprows: int) -> pd.DataFrame:
+def pandas_read_vcf_table(path: str, skiprows: int, chunksize: Optional[int] = None):
     """
     Read VCF body with pandas, handling gzip/bgzip compression.
+    If chunksize is given, returns an iterator of DataFrames of that many rows
+    (bounded memory) instead of one DataFrame.
+    If pyarrow is installed, columns are Arrow-backed: genotype strings live in
+    contiguous buffers and .str operations run as Arrow compute kernels.
     """
+    kwargs = {"dtype_backend": "pyarrow"} if HAVE_PYARROW else {}
+    if chunksize:
+        kwargs["chunksize"] = chunksize
     lower = path.lower()
     if lower.endswith((".gz", ".bgz", ".bgzip")):
-        return pd.read_table(path, skiprows=skiprows, compression="gzip")
-    return pd.read_table(path, skiprows=skiprows)
+        return pd.read_table(path, skiprows=skiprows, compression="gzip", **kwargs)
+    return pd.read_table(path, skiprows=skiprows, **kwargs)
 
 
 # -------------------------
 # Genotype checks
 # -------------------------
+# GT separators are single chars: map "|" to "/" and use str.split (no regex)
+_PIPE_TO_SLASH = str.maketrans("|", "/")
+
+
+@lru_cache(maxsize=4096)
+def is_het_gt(gt: str) -> bool:
+    """
+    Heterozygosity of a bare GT string:
+    - Splits by / or | (via str.translate + str.split).
+    - If >1 distinct allele codes => heterozygous (e.g., 0/1, 0/2, 1/2).
+    Cached: a VCF only holds a handful of distinct GT strings.
+    """
+    # Biallelic fast path (e.g. 0/1, 1|1, ./.): compare the two allele chars directly.
+    # Only when both ends are allele chars, malformed GTs like "|//" take the split below
+    if len(gt) == 3 and gt[1] in "/|" and gt[0] not in "/|" and gt[2] not in "/|":
+        c0, c2 = gt[0], gt[2]
+        return c0 != c2 and c0 != "." and c2 != "."
+    alleles = set(gt.translate(_PIPE_TO_SLASH).split("/"))
+    alleles.discard(".")
+    return len(alleles) > 1
+
+
 def is_het_from_gt(cell: str) -> bool:
     """
     GT-based heterozygosity detection:
     - Looks at first FORMAT subfield (GT).
-    - Splits by / or |.
-    - If >1 distinct allele codes => heterozygous (e.g., 0/1, 0/2, 1/2).
+    - Heterozygous as defined by is_het_gt.
     """
     if not isinstance(cell, str) or ":" not in cell:
         return False
-    gt = cell.split(":", 1)[0]
-    alleles = set(re.split(r"[|/]", gt))
-    alleles.discard(".")
-    return len(alleles) > 1
+    return is_het_gt(cell.split(":", 1)[0])
+
+
+def split_gt_cells(cells: np.ndarray):
+    """
+    Split sample cells at the first ":" with plain str.partition (no fixed-width copy).
+    Returns (gt, has_fmt) as flat arrays:
+    - gt: GT subfield of each cell
+    - has_fmt: True where the cell has FORMAT subfields after GT
+    Missing (non-str) cells count as an empty GT without FORMAT subfields.
+    """
+    flat = np.asarray(cells, dtype=object).reshape(-1)
+    parts = [c.partition(":") if isinstance(c, str) else ("", "", "") for c in flat]
+    gt = np.array([p[0] for p in parts], dtype=object)
+    has_fmt = np.fromiter((p[1] == ":" for p in parts), dtype=bool, count=len(parts))
+    return gt, has_fmt
+
+
+if HAVE_NUMBA:
+    @njit(cache=True, parallel=True)
+    def scan_gt(buf, starts, ends):
+        """
+        Numba kernel over cells packed in one uint8 buffer (cell i is buf[starts[i]:ends[i]]).
+        A cell is heterozygous if it has a ":" and its GT holds two different
+        allele codes other than "." (any ploidy, any allele code width).
+        """
+        n = starts.shape[0]
+        het = np.zeros(n, dtype=np.bool_)
+        for i in prange(n):
+            end = ends[i]
+            first_start = -1
+            first_len = 0
+            tok_start = starts[i]
+            j = starts[i]
+            while j < end and buf[j] != 58:  # ':'
+                j += 1
+            if j == end:
+                continue
+            gt_end = j
+            # Biallelic fast path (0/1, 1|1, ./. ...): branchless compare of the two allele bytes
+            if gt_end - tok_start == 3 and (buf[tok_start + 1] == 47 or buf[tok_start + 1] == 124):
+                b0 = buf[tok_start]
+                b2 = buf[tok_start + 2]
+                if b0 != 47 and b0 != 124 and b2 != 47 and b2 != 124:
+                    het[i] = (b0 != b2) & (b0 != 46) & (b2 != 46)
+                    continue
+            found = False
+            j = tok_start
+            while j <= gt_end and not found:
+                if j == gt_end or buf[j] == 47 or buf[j] == 124:  # '/' '|'
+                    tok_len = j - tok_start
+                    if not (tok_len == 1 and buf[tok_start] == 46):  # '.'
+                        if first_start < 0:
+                            first_start = tok_start
+                            first_len = tok_len
+                        elif tok_len != first_len:
+                            found = True
+                        else:
+                            for k in range(tok_len):
+                                if buf[tok_start + k] != buf[first_start + k]:
+                                    found = True
+                                    break
+                    tok_start = j + 1
+                j += 1
+            het[i] = found
+        return het
+
+
+def pack_cells(cells: np.ndarray):
+    """
+    Pack cells into one contiguous ASCII buffer plus start/end offsets for scan_gt.
+    Missing (non-str) cells are packed as empty strings.
+    """
+    flat = [c if isinstance(c, str) else "" for c in np.asarray(cells, dtype=object).reshape(-1)]
+    lengths = np.fromiter(map(len, flat), dtype=np.int64, count=len(flat))
+    starts = np.zeros(len(flat), dtype=np.int64)
+    np.cumsum(lengths[:-1] + 1, out=starts[1:])
+    buf = np.frombuffer("\x00".join(flat).encode("ascii", errors="replace"), dtype=np.uint8)
+    return buf, starts, starts + lengths
+
+
+def het_mask_from_cells(cells: np.ndarray) -> np.ndarray:
+    """
+    Array version of is_het_from_gt, returns a flat boolean mask.
+    - With numba installed, all cells go through the compiled scan_gt kernel.
+    - Otherwise GT strings are factorized (like a categorical): only the handful
+      of distinct GTs are checked with is_het_gt, then broadcast back to the cells.
+    """
+    flat = np.asarray(cells, dtype=object).reshape(-1)
+    if HAVE_NUMBA:
+        return scan_gt(*pack_cells(flat))
+
+    gt, has_fmt = split_gt_cells(flat)
+    codes, uniques = pd.factorize(gt)
+    het_uniques = np.fromiter((is_het_gt(u) for u in uniques), dtype=bool, count=len(uniques))
+    return has_fmt & het_uniques[codes]
+
+
+def het_mask_from_gt(col: pd.Series) -> pd.Series:
+    """
+    Column-wise version of is_het_from_gt.
+    Returns a boolean Series aligned with col.
+    """
+    return pd.Series(het_mask_from_cells(col.to_numpy(dtype=object)), index=col.index)
+
+
+@lru_cache(maxsize=128)
+def _ad_index(format_str: str) -> int:
+    """
+    Position of AD in a FORMAT string, or -1 if absent.
+    Cached: FORMAT is constant over long runs of rows.
+    """
+    fmt_keys = format_str.split(":")
+    return fmt_keys.index("AD") if "AD" in fmt_keys else -1
 
 
 def parse_ad_from_row(format_str: str, sample_str: str) -> Optional[List[int]]:
@@ -74,14 +242,13 @@ def parse_ad_from_row(format_str: str, sample_str: str) -> Optional[List[int]]:
     if ":" not in sample_str:
         return None
 
-    fmt_keys = format_str.split(":")
-    vals = sample_str.split(":")
-    if len(vals) < len(fmt_keys):
-        vals = vals + [""] * (len(fmt_keys) - len(vals))
+    ad_idx = _ad_index(format_str)
+    if ad_idx < 0:
+        return None
 
-    try:
-        ad_idx = fmt_keys.index("AD")
-    except ValueError:
+    # Missing trailing subfields count as empty
+    vals = sample_str.split(":")
+    if len(vals) <= ad_idx:
         return None
 
     ad_raw = vals[ad_idx]
@@ -131,63 +298,286 @@ def ad_has_alt_balanced_against_ref(ad_depths: List[int], low: float = 0.2, high
     return False
 
 
+def ad_format_groups(df: pd.DataFrame) -> List[Tuple[int, pd.Index]]:
+    """
+    Group rows by FORMAT string (usually constant over long runs of rows).
+    Returns (AD subfield index, row labels) for every FORMAT that has AD.
+    """
+    groups = []
+    for fmt, rows in df.groupby("FORMAT", sort=False).groups.items():
+        ad_idx = _ad_index(str(fmt))
+        if ad_idx >= 0:
+            groups.append((ad_idx, rows))
+    return groups
+
+
+def ad_mask_from_column(col: pd.Series, groups: List[Tuple[int, pd.Index]], low: float = 0.2, high: float = 1.8) -> pd.Series:
+    """
+    Column-wise version of parse_ad_from_row + ad_has_alt_balanced_against_ref.
+    AD strings are validated with one regex and parsed with pd.to_numeric
+    (errors="coerce", rows with unparsed depths are skipped);
+    ALT/REF ratios are computed for all rows of a FORMAT group at once.
+    """
+    s = col.astype("string")
+    mask = pd.Series(False, index=col.index)
+    for ad_idx, rows in groups:
+        cells = s.loc[rows]
+        ad_raw = cells.str.split(":").str[ad_idx].astype("string")
+        # Same rejections as parse_ad_from_row: no ":" in cell, missing/empty values, < 2 depths
+        has_fmt = cells.str.contains(":", regex=False).fillna(False).astype(bool)
+        valid = has_fmt & ad_raw.str.fullmatch(r"[+-]?\d+(?:,[+-]?\d+)+").fillna(False).astype(bool)
+        if not valid.any():
+            continue
+
+        ad_raw = ad_raw[valid]
+        depths = ad_raw.str.split(",", expand=True).apply(pd.to_numeric, errors="coerce").astype(float)
+        # Short AD lists are NaN-padded by expand=True; any other NaN is a value
+        # parse_ad_from_row would have rejected, so drop those rows
+        parsed = depths.notna().sum(axis=1) == ad_raw.str.count(",").astype(int) + 1
+        depths = depths[parsed.to_numpy()]
+        if depths.empty:
+            continue
+        ref = depths[0]
+        ratio = depths.iloc[:, 1:].div(ref, axis=0)
+        balanced = ((ratio >= low) & (ratio <= high)).any(axis=1)
+        # Ignore rows where any AD value is 0 (and keep ref > 0)
+        flag = balanced & ~(depths == 0).any(axis=1) & (ref > 0)
+        mask[flag.index[flag.to_numpy()]] = True
+    return mask
+
+
 # -------------------------
 # Main scanning / modifying
 # -------------------------
-def find_heterozygous_positions_gt(df: pd.DataFrame, individuals: List[str]) -> pd.DataFrame:
-    het_positions = []
-    for ind in tqdm(individuals, desc="Scanning for heterozygous positions (GT)", unit="individual"):
-        for idx, cell in df[ind].items():
-            if is_het_from_gt(cell):
-                het_positions.append([df.at[idx, "#CHROM"], df.at[idx, "POS"]])
-    return pd.DataFrame(het_positions, columns=["#CHROM", "POS"]).drop_duplicates()
+def progress(iterable, **kwargs):
+    """
+    tqdm at individual (column) granularity, never per variant.
+    Silent when stderr is not a terminal (batch jobs, redirected logs).
+    """
+    return tqdm(iterable, disable=not sys.stderr.isatty(), mininterval=0.5, **kwargs)
 
 
-def find_positions_ad(df: pd.DataFrame, individuals: List[str], low: float = 0.2, high: float = 1.8) -> pd.DataFrame:
-    ad_positions = []
-    if "FORMAT" not in df.columns:
-        raise ValueError("VCF body is missing FORMAT column; cannot use --AD mode.")
+def map_columns(fn, columns: list, executor: Optional[Executor] = None, desc: str = "Processing individuals") -> list:
+    """
+    Apply fn to every sample column. Columns are independent, so given an
+    executor (one pool for the whole run, see main) they are spread over its
+    worker processes; results keep the input order.
+    """
+    if executor is not None and len(columns) > 1:
+        return list(progress(executor.map(fn, columns), total=len(columns), desc=desc, unit="individual"))
+    return [fn(col) for col in progress(columns, desc=desc, unit="individual")]
+
+
+def positions_from_masks(df: pd.DataFrame, masks: List[pd.Series]) -> pd.DataFrame:
+    """
+    Gather [#CHROM, POS] of flagged rows with one array lookup.
+    Hits are deduplicated as int64 row positions (np.unique), which also
+    puts them in file order, before touching the #CHROM/POS objects.
+    """
+    chrom_arr = df["#CHROM"].to_numpy()
+    pos_arr = df["POS"].to_numpy()
+    hit_idx = np.unique(np.concatenate([np.flatnonzero(np.asarray(mask)) for mask in masks]))
+    return pd.DataFrame({"#CHROM": chrom_arr[hit_idx], "POS": pos_arr[hit_idx]})
 
-    for ind in tqdm(individuals, desc="Scanning positions (AD vs REF)", unit="individual"):
-        for idx, sample_cell in df[ind].items():
-            fmt = df.at[idx, "FORMAT"]
-            ad = parse_ad_from_row(fmt, sample_cell)
-            if ad is None:
-                continue
 
-            if ad_has_alt_balanced_against_ref(ad, low=low, high=high):
-                ad_positions.append([df.at[idx, "#CHROM"], df.at[idx, "POS"]])
+def find_heterozygous_positions_gt(df: pd.DataFrame, individuals: List[str],
+                                   executor: Optional[Executor] = None) -> pd.DataFrame:
+    # The numba GT kernel is already multi-threaded, worker processes only help the fallback
+    masks = map_columns(het_mask_from_gt, [df[ind] for ind in individuals],
+                        executor=None if HAVE_NUMBA else executor,
+                        desc="Scanning for heterozygous positions (GT)")
+    return positions_from_masks(df, masks)
 
-    return pd.DataFrame(ad_positions, columns=["#CHROM", "POS"]).drop_duplicates()
 
+def find_positions_ad(df: pd.DataFrame, individuals: List[str], low: float = 0.2, high: float = 1.8,
+                      executor: Optional[Executor] = None) -> pd.DataFrame:
+    if "FORMAT" not in df.columns:
+        raise ValueError("VCF body is missing FORMAT column; cannot use --AD mode.")
+
+    groups = ad_format_groups(df)
+    masks = map_columns(partial(ad_mask_from_column, groups=groups, low=low, high=high),
+                        [df[ind] for ind in individuals], executor=executor, desc="Scanning positions (AD vs REF)")
+    return positions_from_masks(df, masks)
 
-def set_positions_to_missing(df: pd.DataFrame, individuals: List[str], use_ad: bool, low: float = 0.2, high: float = 1.8) -> None:
+
+def set_positions_to_missing(df: pd.DataFrame, individuals: List[str], use_ad: bool, low: float = 0.2, high: float = 1.8,
+                             executor: Optional[Executor] = None) -> np.ndarray:
     """
     Set flagged haploid sample genotypes to missing:
     - If use_ad: flag rows where AD indicates alt depth balanced vs ref depth
     - Else: flag rows where GT is heterozygous
+    Given an executor, the per-individual checks run in its worker processes
+    (the numba GT kernel is already multi-threaded and does not use it).
+    Returns the (n_variants, n_haploid) boolean mask of modified cells.
     """
     if use_ad and "FORMAT" not in df.columns:
         raise ValueError("VCF body is missing FORMAT column; cannot use --AD mode.")
 
-    for ind in tqdm(individuals, desc="Processing individuals", unit="individual"):
-        for idx, cell in df[ind].items():
-            if not isinstance(cell, str) or ":" not in cell:
-                continue
-
-            flag = False
-            if use_ad:
-                fmt = df.at[idx, "FORMAT"]
-                ad = parse_ad_from_row(fmt, cell)
-                if ad is not None and ad_has_alt_balanced_against_ref(ad, low=low, high=high):
-                    flag = True
-            else:
-                flag = is_het_from_gt(cell)
+    if not use_ad:
+        # Work on the haploid block as one (n_variants, n_haploid) array, write back once.
+        # copy=True: with a single column pandas hands back a read-only view (copy-on-write)
+        sub = df[individuals].to_numpy(dtype=object, copy=True)
+        flat = sub.reshape(-1)
+        if HAVE_NUMBA or executor is None:
+            mask = het_mask_from_cells(flat)
+        else:
+            mask = np.column_stack(map_columns(het_mask_from_cells, list(sub.T), executor=executor)).reshape(-1)
+        if mask.any():
+            # Only the flagged cells are touched, everything from the first ":" on is kept as is
+            flat[mask] = ["./." + cell[cell.index(":"):] for cell in flat[mask]]
+            df[individuals] = flat.reshape(sub.shape)
+        return mask.reshape(sub.shape)
+
+    groups = ad_format_groups(df)
+    masks = map_columns(partial(ad_mask_from_column, groups=groups, low=low, high=high),
+                        [df[ind] for ind in individuals], executor=executor)
+    for ind, mask in zip(individuals, masks):
+        if mask.any():
+            # Swap the GT prefix in place, everything from the first ":" on is kept as is
+            df.loc[mask, ind] = df.loc[mask, ind].astype("string").str.replace(r"^[^:]*", "./.", n=1, regex=True)
+    return np.column_stack([np.asarray(mask) for mask in masks])
+
+
+def write_modified_vcf(path: str, rownum: int, output_vcf: str, individuals: List[str], chunks) -> None:
+    """
+    Copy the VCF to output_vcf, splicing in only the flagged haploid cells.
+    chunks yields (DataFrame, flagged mask) pairs covering the VCF body in order.
+    Every other line and cell is written exactly as read, so unchanged data
+    is never re-formatted by pandas. Blank lines (skipped by pandas) are copied
+    through, and each spliced line is checked against the #CHROM/POS of its row.
+    """
+    with open_maybe_gzip(path, "rt") as vcf_file, open(output_vcf, "w", buffering=1 << 20) as out:
+        header_lines = [next(vcf_file) for _ in range(rownum + 1)]
+        out.writelines(header_lines)
+        columns = header_lines[-1].rstrip("\n").split("\t")
+        sample_ix = [columns.index(ind) for ind in individuals]
+        for df, flagged in chunks:
+            values = df[individuals].to_numpy(dtype=object)
+            chrom_arr = df["#CHROM"].to_numpy()
+            pos_arr = df["POS"].to_numpy()
+            flagged_rows = flagged.any(axis=1)
+            for i in range(len(df)):
+                line = next(vcf_file)
+                while not line.strip(" \r\n"):
+                    out.write(line)
+                    line = next(vcf_file)
+                if not flagged_rows[i]:
+                    out.write(line)
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] != str(chrom_arr[i]) or fields[1] != str(pos_arr[i]):
+                    raise ValueError(f"VCF line {fields[0]}:{fields[1]} does not match parsed row "
+                                     f"{chrom_arr[i]}:{pos_arr[i]}; cannot splice modified genotypes.")
+                for k in np.flatnonzero(flagged[i]):
+                    fields[sample_ix[k]] = values[i, k]
+                out.write("\t".join(fields) + "\n")
+        # Anything after the last parsed row (trailing blank lines)
+        out.writelines(vcf_file)
+
+
+def stream_vcf(path: str, rownum: int, individuals: List[str], use_ad: bool, low: float = 0.2, high: float = 1.8,
+               output_vcf: Optional[str] = None) -> pd.DataFrame:
+    """
+    Single pass over the VCF, one line at a time (memory does not grow with file size):
+    - Flags haploid sample genotypes like set_positions_to_missing (GT or AD rule)
+    - If output_vcf is given, writes every line with flagged genotypes set to missing
+    Returns the flagged [#CHROM, POS] in file order.
+    GT mode on an uncompressed VCF runs in the compiled vcf_haploid_fix extension when it is built.
+    """
+    compressed = path.lower().endswith((".gz", ".bgz", ".bgzip"))
+    if HAVE_VCF_HAPLOID_FIX and not use_ad and not compressed:
+        with open(path, "r") as vcf_file:
+            columns = [next(vcf_file) for _ in range(rownum + 1)][-1].rstrip("\n").split("\t")
+        sample_ix = [columns.index(ind) for ind in individuals]
+        positions = vcf_haploid_fix.process(path, output_vcf, sample_ix, rownum + 1)
+        return pd.DataFrame(positions, columns=["#CHROM", "POS"])
+
+    positions = []
+    with open_maybe_gzip(path, "rt") as vcf_file:
+        header_lines = [next(vcf_file) for _ in range(rownum + 1)]
+        columns = header_lines[-1].rstrip("\n").split("\t")
+        if use_ad and "FORMAT" not in columns:
+            raise ValueError("VCF body is missing FORMAT column; cannot use --AD mode.")
+        fmt_ix = columns.index("FORMAT") if use_ad else -1
+        sample_ix = [columns.index(ind) for ind in individuals]
+        min_fields = max(sample_ix) + 1
+
+        out = open(output_vcf, "w", buffering=1 << 20) if output_vcf else None
+        try:
+            if out:
+                out.writelines(header_lines)
+            for line in vcf_file:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < min_fields:
+                    # Blank or truncated line: no haploid cells to check, copy it through
+                    if out:
+                        out.write(line)
+                    continue
+                flagged = False
+                for j in sample_ix:
+                    cell = fields[j]
+                    if ":" not in cell:
+                        continue
+                    if use_ad:
+                        ad = parse_ad_from_row(fields[fmt_ix], cell)
+                        flag = ad is not None and ad_has_alt_balanced_against_ref(ad, low=low, high=high)
+                    else:
+                        flag = is_het_from_gt(cell)
+                    if flag:
+                        flagged = True
+                        fields[j] = "./." + cell[cell.index(":"):]
+                if flagged:
+                    positions.append([fields[0], fields[1]])
+                if out:
+                    out.write("\t".join(fields) + "\n" if flagged else line)
+        finally:
+            if out:
+                out.close()
+
+    return pd.DataFrame(positions, columns=["#CHROM", "POS"])
+
+
+def polars_vcf(path: str, rownum: int, individuals: List[str], header_lines: List[str],
+               output_vcf: Optional[str] = None) -> pd.DataFrame:
+    """
+    GT mode on polars: the whole rewrite is one lazy query of Rust string
+    kernels, run multi-threaded over all haploid columns.
+    - If output_vcf is given, writes the VCF with heterozygous GTs set to missing
+    Returns the flagged [#CHROM, POS] in file order.
+    """
+    read_kwargs = dict(separator="\t", skip_rows=rownum, quote_char=None, infer_schema=False)
+    if path.lower().endswith((".gz", ".bgz", ".bgzip")):
+        lf = pl.read_csv(path, **read_kwargs).lazy()
+    else:
+        lf = pl.scan_csv(path, **read_kwargs)
+    # Blank lines come back as all-null rows, drop them rather than write them back as empty records
+    lf = lf.filter(pl.col("POS").is_not_null())
+
+    # Same rule as is_het_from_gt: has FORMAT subfields and >1 distinct allele codes other than "."
+    het = {}
+    for ind in individuals:
+        cell = pl.col(ind)
+        alleles = (cell.str.split_exact(":", 1).struct.field("field_0")
+                   .str.replace_all("|", "/", literal=True).str.split("/")
+                   .list.eval(pl.element().filter(pl.element() != ".")))
+        het[ind] = cell.str.contains(":", literal=True) & (alleles.list.n_unique() > 1)
+
+    any_het = pl.any_horizontal(list(het.values()))
+    if not output_vcf:
+        positions = lf.filter(any_het).select("#CHROM", "POS").collect()
+        return pd.DataFrame(positions.to_dict(as_series=False))
+
+    # One pass: the rewrite and a per-row flag come out of the same collect()
+    modified = lf.with_columns([any_het.alias("_flagged")] + [
+        pl.when(expr).then(pl.col(ind).str.replace(r"^[^:]*", "./.")).otherwise(pl.col(ind)).alias(ind)
+        for ind, expr in het.items()
+    ]).collect()
+    positions = modified.filter(pl.col("_flagged")).select("#CHROM", "POS")
+    with open(output_vcf, "w") as out_vcf:
+        out_vcf.writelines(header_lines)
+        modified.drop("_flagged").write_csv(out_vcf, separator="\t", include_header=False, quote_style="never")
 
-            if flag:
-                fields = cell.split(":")
-                fields[0] = "./."
-                df.at[idx, ind] = ":".join(fields)
+    return pd.DataFrame(positions.to_dict(as_series=False))
 
 
 def main():
@@ -201,47 +591,101 @@ def main():
     parser.add_argument("--AD", action="store_true", help="Use AD field to check allele balance instead of GT field")
     parser.add_argument("--low", type=float, default=0.2, help="Lower bound for ALT/REF ratio in AD mode (default 0.2)")
     parser.add_argument("--high", type=float, default=1.8, help="Upper bound for ALT/REF ratio in AD mode (default 1.8)")
+    parser.add_argument("--engine", choices=["stream", "pandas", "polars"], default="stream",
+                        help="stream: process the VCF line by line with low memory (default); "
+                             "pandas: read the VCF body into DataFrames in chunks of rows; "
+                             "polars: multi-threaded polars query (GT mode only, needs polars)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="pandas engine: worker processes for the per-individual AD checks, and for the GT "
+                             "checks when numba is not installed (default 1)")
+    parser.add_argument("--materialize", action="store_true",
+                        help="pandas engine: write the whole DataFrame with to_csv instead of splicing "
+                             "modified cells into a copy of the input")
+    parser.add_argument("--chunksize", type=int, default=50_000,
+                        help="pandas engine: number of VCF rows read and processed at a time (default 50000)")
 
     args = parser.parse_args()
+    if args.engine == "polars" and (args.AD or not HAVE_POLARS):
+        parser.error("--engine polars needs the polars package and does not support --AD")
 
     # Read VCF header lines
     with open_maybe_gzip(args.vcf, "rt") as vcf_file:
         header_lines = [next(vcf_file) for _ in range(args.rownum + 1)]
 
-    # Read VCF body
-    vcf = pandas_read_vcf_table(args.vcf, skiprows=args.rownum)
+    columns = header_lines[-1].rstrip("\n").split("\t")
 
     # Read haploid list
     with open(args.list, "r") as f:
-        haploid_individuals = set(f.read().splitlines())
+        haploid_set = set(f.read().splitlines())
 
-    # Keep only samples that exist
-    haploid_individuals = [ind for ind in haploid_individuals if ind in vcf.columns]
+    # Keep only samples that exist, in VCF column order (deterministic output, sequential column access)
+    haploid_individuals = [ind for ind in columns if ind in haploid_set]
     if not haploid_individuals:
         print("Error: No valid haploid individuals found in VCF. Exiting.")
         raise SystemExit(1)
 
-    # --matt: output flagged positions only
-    if args.matt:
-        if args.AD:
-            positions = find_positions_ad(vcf, haploid_individuals, low=args.low, high=args.high)
-            out = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_AD_positions.txt", args.vcf, flags=re.IGNORECASE)
+    if args.engine == "stream":
+        if args.matt:
+            suffix = "_AD_positions.txt" if args.AD else "_het_positions.txt"
+            out = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", suffix, args.vcf, flags=re.IGNORECASE)
+            positions = stream_vcf(args.vcf, args.rownum, haploid_individuals, use_ad=args.AD, low=args.low, high=args.high)
             positions.to_csv(out, sep="\t", index=False)
-            print(f"AD-based positions saved as {out}")
+            label = "AD-based positions" if args.AD else "Heterozygous positions"
+            print(f"{label} saved as {out}")
         else:
-            positions = find_heterozygous_positions_gt(vcf, haploid_individuals)
+            output_vcf = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_modified.vcf", args.vcf, flags=re.IGNORECASE)
+            stream_vcf(args.vcf, args.rownum, haploid_individuals, use_ad=args.AD, low=args.low, high=args.high,
+                       output_vcf=output_vcf)
+            print(f"Modified VCF file saved as {output_vcf}")
+        raise SystemExit(0)
+
+    if args.engine == "polars":
+        if args.matt:
             out = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_het_positions.txt", args.vcf, flags=re.IGNORECASE)
+            positions = polars_vcf(args.vcf, args.rownum, haploid_individuals, header_lines)
             positions.to_csv(out, sep="\t", index=False)
             print(f"Heterozygous positions saved as {out}")
+        else:
+            output_vcf = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_modified.vcf", args.vcf, flags=re.IGNORECASE)
+            polars_vcf(args.vcf, args.rownum, haploid_individuals, header_lines, output_vcf=output_vcf)
+            print(f"Modified VCF file saved as {output_vcf}")
         raise SystemExit(0)
 
-    # Modify VCF
-    set_positions_to_missing(vcf, haploid_individuals, use_ad=args.AD, low=args.low, high=args.high)
-
-    output_vcf = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_modified.vcf", args.vcf, flags=re.IGNORECASE)
-    with open(output_vcf, "w") as out_vcf:
-        out_vcf.writelines(header_lines)
-    vcf.to_csv(output_vcf, sep="\t", index=False, mode="a", header=True)
+    # One worker pool for the whole run, shared by every chunk (-j 1: no pool)
+    with (ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else nullcontext()) as executor:
+        # Read VCF body in chunks of rows
+        chunks = pandas_read_vcf_table(args.vcf, skiprows=args.rownum, chunksize=args.chunksize)
+
+        # --matt: output flagged positions only
+        if args.matt:
+            if args.AD:
+                positions = pd.concat([find_positions_ad(chunk, haploid_individuals, low=args.low, high=args.high,
+                                                         executor=executor) for chunk in chunks], ignore_index=True)
+                out = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_AD_positions.txt", args.vcf, flags=re.IGNORECASE)
+                positions.to_csv(out, sep="\t", index=False)
+                print(f"AD-based positions saved as {out}")
+            else:
+                positions = pd.concat([find_heterozygous_positions_gt(chunk, haploid_individuals, executor=executor)
+                                       for chunk in chunks], ignore_index=True)
+                out = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_het_positions.txt", args.vcf, flags=re.IGNORECASE)
+                positions.to_csv(out, sep="\t", index=False)
+                print(f"Heterozygous positions saved as {out}")
+            raise SystemExit(0)
+
+        # Modify VCF, one chunk at a time
+        processed = ((chunk, set_positions_to_missing(chunk, haploid_individuals, use_ad=args.AD, low=args.low,
+                                                      high=args.high, executor=executor))
+                     for chunk in chunks)
+
+        output_vcf = re.sub(r"(\.vcf)(\.(gz|bgz|bgzip))?$", r"_modified.vcf", args.vcf, flags=re.IGNORECASE)
+        if args.materialize:
+            with open(output_vcf, "w") as out_vcf:
+                out_vcf.writelines(header_lines)
+                # header_lines already ends with the #CHROM line
+                for chunk, _ in processed:
+                    chunk.to_csv(out_vcf, sep="\t", index=False, header=False)
+        else:
+            write_modified_vcf(args.vcf, args.rownum, output_vcf, haploid_individuals, processed)
 
     print(f"Modified VCF file saved as {output_vcf}")
 
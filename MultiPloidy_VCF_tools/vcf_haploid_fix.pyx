@@ -0,0 +1,157 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+
+# >><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>>
+# C line parser for set_haploid_hetero_to_missing_V3.py (GT mode)         >>
+# Build: CFLAGS="-O3 -march=native" cythonize -i vcf_haploid_fix.pyx      >>
+# >><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>><<>>
+
+"""
+Line-at-a-time VCF pass in C: for every haploid sample column, scan the GT
+subfield up to the first ":" and, if it holds two different allele codes
+(other than "."), write "./." in its place. Same rule as is_het_from_gt.
+"""
+
+from libc.stdio cimport FILE, fopen, fclose, fwrite
+from libc.stdlib cimport free, calloc
+from libc.string cimport memcpy, strerror
+from libc.errno cimport errno
+from libc.stdint cimport uint32_t
+
+cdef extern from "stdio.h":
+    ssize_t getline(char **lineptr, size_t *n, FILE *stream)
+
+
+cdef inline bint gt_is_het(const char *gt, Py_ssize_t n) nogil:
+    # Biallelic fast path (0/1, 1|1, ./. ...): the caller guarantees a ":" at gt[n],
+    # so 4 bytes can be loaded as one word and compared branchless (little-endian).
+    cdef uint32_t x
+    cdef unsigned char b0, b1, b2
+    if n == 3:
+        memcpy(&x, gt, 4)
+        b0 = x & 0xff
+        b1 = (x >> 8) & 0xff
+        b2 = (x >> 16) & 0xff
+        if ((b1 == b'/' or b1 == b'|') and b0 != b'/' and b0 != b'|'
+                and b2 != b'/' and b2 != b'|'):
+            return (b0 != b2) & (b0 != b'.') & (b2 != b'.')
+
+    # Compare every allele token with the first non-"." token (any width, any ploidy)
+    cdef Py_ssize_t j = 0, tok = 0, first = -1, first_len = 0, tok_len, k
+    while j <= n:
+        if j == n or gt[j] == b'/' or gt[j] == b'|':
+            tok_len = j - tok
+            if not (tok_len == 1 and gt[tok] == b'.'):
+                if first < 0:
+                    first = tok
+                    first_len = tok_len
+                elif tok_len != first_len:
+                    return True
+                else:
+                    for k in range(tok_len):
+                        if gt[tok + k] != gt[first + k]:
+                            return True
+            tok = j + 1
+        j += 1
+    return False
+
+
+cdef int write_out(FILE *fout, const char *buf, size_t n) except -1:
+    # fwrite may write short (disk full, I/O error): surface it instead of truncating silently
+    if fwrite(buf, 1, n, fout) != n:
+        raise OSError(errno, f"Write failed: {strerror(errno).decode()}")
+    return 0
+
+
+def process(str in_path, out_path, haploid_col_indices, int header_lines):
+    """
+    Copy in_path to out_path (if not None) with heterozygous GTs of the given
+    0-based column indices set to missing. The first header_lines lines are
+    copied unchanged. Returns the (#CHROM, POS) of every modified line.
+    """
+    cdef FILE *fin = fopen(in_path.encode(), b"rb")
+    if fin == NULL:
+        raise OSError(f"Cannot open {in_path}")
+    cdef FILE *fout = NULL
+    if out_path is not None:
+        fout = fopen(out_path.encode(), b"wb")
+        if fout == NULL:
+            fclose(fin)
+            raise OSError(f"Cannot open {out_path}")
+
+    cdef Py_ssize_t max_col = max(haploid_col_indices) + 1
+    cdef char *is_hap = <char *> calloc(max_col, 1)
+    if is_hap == NULL:
+        fclose(fin)
+        if fout != NULL:
+            fclose(fout)
+        raise MemoryError()
+    for c in haploid_col_indices:
+        is_hap[c] = 1
+
+    cdef char *line = NULL
+    cdef size_t cap = 0
+    cdef ssize_t n
+    cdef Py_ssize_t i, col, cell, colon, last, tab1, tab2
+    cdef int lineno = 0, rc
+    cdef bint flagged
+    positions = []
+
+    try:
+        while True:
+            n = getline(&line, &cap, fin)
+            if n < 0:
+                break
+            if lineno < header_lines:
+                lineno += 1
+                if fout != NULL:
+                    write_out(fout, line, n)
+                continue
+
+            flagged = False
+            last = 0
+            col = 0
+            cell = 0
+            tab1 = tab2 = -1
+            i = 0
+            while i <= n and col < max_col:
+                if i == n or line[i] == b'\t' or line[i] == b'\n':
+                    if col == 0:
+                        tab1 = i
+                    elif col == 1:
+                        tab2 = i
+                    if is_hap[col]:
+                        colon = cell
+                        while colon < i and line[colon] != b':':
+                            colon += 1
+                        if colon < i and gt_is_het(line + cell, colon - cell):
+                            flagged = True
+                            if fout != NULL:
+                                write_out(fout, line + last, cell - last)
+                                write_out(fout, b"./.", 3)
+                            last = colon
+                    if i == n or line[i] == b'\n':
+                        break
+                    col += 1
+                    cell = i + 1
+                i += 1
+
+            if fout != NULL:
+                write_out(fout, line + last, n - last)
+            if flagged:
+                positions.append((line[:tab1].decode(), line[tab1 + 1:tab2].decode()))
+            lineno += 1
+
+        # Buffered data is only flushed here, so a full disk may first show up at fclose
+        if fout != NULL:
+            rc = fclose(fout)
+            fout = NULL
+            if rc != 0:
+                raise OSError(errno, f"Cannot write {out_path}: {strerror(errno).decode()}")
+    finally:
+        free(line)
+        free(is_hap)
+        fclose(fin)
+        if fout != NULL:
+            fclose(fout)
+
+    return positions